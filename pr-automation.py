@@ -6,9 +6,17 @@ Automatically creates PRs across environments (Quality -> PreProd -> Production)
 
 import os
 import sys
+import json
 import subprocess
+import time
+import tempfile
 import requests
-from datetime import datetime
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from typing import Optional, Tuple, List, Dict
 import argparse
 from dotenv import load_dotenv
@@ -37,6 +45,31 @@ class GitHubPRAutomation:
         {'name': 'Production', 'branch': 'main', 'suffix': 'main', 'title_prefix': 'stg-main', 'key': 'main'}
     ]
     
+    # Longest rate-limit wait worth blocking on; beyond this the request fails instead
+    MAX_RATE_LIMIT_WAIT = 120
+    
+    ETAG_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'github-pr-automation', 'etags.json')
+    
+    COMMIT_HISTORY_QUERY = """
+    query($owner: String!, $name: String!, $ref: String!, $cursor: String) {
+      repository(owner: $owner, name: $name) {
+        ref(qualifiedName: $ref) {
+          target {
+            ... on Commit {
+              history(first: 100, after: $cursor) {
+                pageInfo { hasNextPage endCursor }
+                nodes {
+                  oid
+                  associatedPullRequests(first: 1, states: MERGED) { nodes { number } }
+                }
+              }
+            }
+          }
+        }
+      }
+    }
+    """
+    
     def __init__(self, github_token: str, repo_owner: str, repo_name: str, 
                  reviewers: List[str] = None,
                  environments: List[str] = None,
@@ -49,6 +82,11 @@ class GitHubPRAutomation:
         self.reviewers = reviewers or []
         self.github_api_url = github_api_url.rstrip('/')
         self.api_base = f"{self.github_api_url}/repos/{repo_owner}/{repo_name}"
+        # GitHub Enterprise serves GraphQL at /api/graphql next to /api/v3
+        if self.github_api_url.endswith('/api/v3'):
+            self.graphql_url = f"{self.github_api_url[:-len('/v3')]}/graphql"
+        else:
+            self.graphql_url = f"{self.github_api_url}/graphql"
         self.cherry_pick_commits = cherry_pick_commits or []
         
         self.headers = {
@@ -57,7 +95,49 @@ class GitHubPRAutomation:
             'Content-Type': 'application/json'
         }
         
+        # Reuse one keep-alive connection for all GitHub API calls
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=10,
+            max_retries=Retry(
+                total=5,
+                backoff_factor=1.0,
+                # 429 is left to _post_with_rate_limit so rate limits have one retry policy
+                status_forcelist=[502, 503, 504],
+                # POST /pulls is not idempotent: a retried 502 can hit "already exists"
+                allowed_methods=['GET', 'HEAD'],
+                raise_on_status=False
+            )
+        )
+        self.session.mount('https://', adapter)
+        
+        # Strip ANSI escapes when piping output or when NO_COLOR is set
+        self._color = sys.stdout.isatty() and not os.environ.get('NO_COLOR')
+        if self._color:
+            self._g, self._r, self._c, self._y, self._b, self._e = (
+                Colors.OKGREEN, Colors.FAIL, Colors.OKCYAN, Colors.WARNING, Colors.BOLD, Colors.ENDC
+            )
+            self._h = f"{Colors.HEADER}{Colors.BOLD}"
+        else:
+            self._g = self._r = self._c = self._y = self._b = self._e = self._h = ''
+        
+        self._git_base = ['git', '-c', 'color.ui=never', '-c', 'core.pager=cat']
+        
+        # One timestamp per run: all staging branches and PR footers share it
+        self._run_start = datetime.now()
+        self._ts_hm = self._run_start.strftime('%H%M')
+        self._ts_full = self._run_start.strftime('%Y-%m-%d %H:%M:%S')
+        self._pr_footer = f"_Created by PR Automation Tool at {self._ts_full}_"
+        
         self.pr_numbers = {}
+        self._remote_refs: Optional[set] = None
+        self._fetched = False
+        self._commit_meta: Optional[Dict[str, Tuple[str, str]]] = None
+        self._staged: Dict[str, Optional[Tuple[str, bool]]] = {}
+        self._history_cache: Dict[str, Tuple[Dict[str, Optional[int]], Optional[str], bool]] = {}
+        self._etag_cache: Optional[Dict[str, str]] = None
         
         # Filter environments based on config
         if environments:
@@ -66,70 +146,184 @@ class GitHubPRAutomation:
                 raise ValueError(f"No valid environments found. Available: qas, stg, main")
         else:
             self.environments = self.ALL_ENVIRONMENTS
+        
+        # Environments before/after each one, for the PR body's Previous/Next lines
+        names = [env['name'] for env in self.environments]
+        self._prev_names = {name: names[:i] for i, name in enumerate(names)}
+        self._next_names = {name: names[i + 1:] for i, name in enumerate(names)}
     
     def print_header(self, text: str):
         """Print a formatted header"""
-        print(f"\n{Colors.HEADER}{Colors.BOLD}{'='*70}{Colors.ENDC}")
-        print(f"{Colors.HEADER}{Colors.BOLD}{text.center(70)}{Colors.ENDC}")
-        print(f"{Colors.HEADER}{Colors.BOLD}{'='*70}{Colors.ENDC}\n")
+        rule = f"{self._h}{'='*70}{self._e}\n"
+        sys.stdout.write(f"\n{rule}{self._h}{text.center(70)}{self._e}\n{rule}\n")
+        sys.stdout.flush()
     
     def print_success(self, text: str):
-        print(f"{Colors.OKGREEN}✓ {text}{Colors.ENDC}")
+        sys.stdout.write(f"{self._g}✓ {text}{self._e}\n")
     
     def print_error(self, text: str):
-        print(f"{Colors.FAIL}✗ {text}{Colors.ENDC}")
+        sys.stdout.write(f"{self._r}✗ {text}{self._e}\n")
+        sys.stdout.flush()
     
     def print_warning(self, text: str):
-        print(f"{Colors.WARNING}⚠ {text}{Colors.ENDC}")
+        # Warnings often precede a sleep or a long git step, so don't leave them buffered
+        sys.stdout.write(f"{self._y}⚠ {text}{self._e}\n")
+        sys.stdout.flush()
     
     def print_info(self, text: str):
-        print(f"{Colors.OKCYAN}ℹ {text}{Colors.ENDC}")
+        sys.stdout.write(f"{self._c}ℹ {text}{self._e}\n")
     
-    def run_git_command(self, command: list, check: bool = True) -> Tuple[bool, str]:
-        """Execute a git command"""
-        try:
-            result = subprocess.run(
-                command,
-                capture_output=True,
-                text=True,
-                check=check
-            )
-            return True, result.stdout.strip()
-        except subprocess.CalledProcessError as e:
-            return False, e.stderr.strip()
+    def run_git_command(self, command: list, input: Optional[str] = None,
+                        cwd: Optional[str] = None) -> Tuple[bool, str]:
+        """Execute a git command, returning (succeeded, output or error text)"""
+        if command and command[0] == 'git':
+            command = self._git_base + command[1:]
+        
+        result = subprocess.run(
+            command,
+            input=input.encode('utf-8') if input is not None else None,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=cwd
+        )
+        stdout = result.stdout.decode('utf-8', 'replace').strip()
+        if result.returncode == 0:
+            return True, stdout
+        
+        # Conflict details go to stdout, fatal errors to stderr
+        stderr = result.stderr.decode('utf-8', 'replace').strip()
+        return False, '\n'.join(part for part in (stdout, stderr) if part)
+    
+    def run_git_command_streaming(self, command: list, cwd: Optional[str] = None,
+                                  label: str = '') -> Tuple[bool, str]:
+        """Execute a long-running git command, echoing its output as it arrives"""
+        if command and command[0] == 'git':
+            command = self._git_base + command[1:]
+        
+        prefix = f"  [{label}] " if label else "  "
+        # Keep only the tail for error reporting so memory doesn't grow with output size
+        tail = deque(maxlen=50)
+        
+        with subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            bufsize=1,
+            text=True,
+            encoding='utf-8',
+            errors='replace',
+            cwd=cwd
+        ) as proc:
+            for line in proc.stdout:
+                line = line.rstrip()
+                if line:
+                    sys.stdout.write(f"{prefix}{line}\n")
+                    # Piped stdout is block-buffered, so push each line out as it arrives
+                    sys.stdout.flush()
+                    tail.append(line)
+            returncode = proc.wait()
+        
+        return returncode == 0, '\n'.join(tail)
+    
+    def is_worktree_clean(self) -> bool:
+        """Check the main working tree for uncommitted changes"""
+        success, output = self.run_git_command(['git', 'status', '--porcelain'])
+        return not (success and output)
+    
+    def _load_remote_refs(self) -> set:
+        """Load all origin/* branch names once so lookups stay in-process"""
+        success, output = self.run_git_command(
+            ['git', 'for-each-ref', '--format=%(refname:short)', 'refs/remotes/origin']
+        )
+        if success:
+            self._remote_refs = {line.removeprefix('origin/') for line in output.splitlines()}
+        else:
+            self._remote_refs = set()
+        return self._remote_refs
     
     def check_branch_exists(self, branch_name: str) -> bool:
         """Check if a branch exists remotely"""
+        if self._remote_refs is not None:
+            return branch_name in self._remote_refs
+        
+        # No full fetch yet - ask the remote for just this one ref
         success, _ = self.run_git_command(
-            ['git', 'rev-parse', '--verify', f'origin/{branch_name}'],
-            check=False
+            ['git', 'ls-remote', '--exit-code', '--heads', 'origin', f'refs/heads/{branch_name}']
         )
         return success
     
     def fetch_all_latest_changes(self):
         """Fetch latest changes from all remote branches"""
-        self.run_git_command(['git', 'fetch', '--all', '--prune'], check=False)
+        self.print_info("Fetching Latest Changes")
+        success, _ = self.run_git_command_streaming(['git', 'fetch', '--all', '--prune'])
+        # Every origin/* ref is now current, so the per-branch fetch can be skipped
+        self._fetched = success
+        self._load_remote_refs()
         
-        success, current_branch = self.run_git_command(['git', 'branch', '--show-current'], check=False)
+        success, current_branch = self.run_git_command(['git', 'branch', '--show-current'])
         if success and current_branch:
-            self.run_git_command(['git', 'pull', 'origin', current_branch], check=False)
+            self.run_git_command(['git', 'pull', 'origin', current_branch])
+    
+    def fetch_environment_branches(self, base_branch: str):
+        """Fetch base and all target branches in a single git invocation"""
+        if self._fetched:
+            return
+        
+        branches = [base_branch] + [env['branch'] for env in self.environments]
+        success, output = self.run_git_command_streaming(['git', 'fetch', 'origin'] + branches)
+        if not success:
+            self.print_warning(f"Failed to fetch {', '.join(branches)}: {output}")
+        
+        self._fetched = True
+        self._remote_refs = None
+    
+    def _load_commit_meta(self) -> Dict[str, Tuple[str, str]]:
+        """Resolve full hash and subject of all cherry-pick commits in two git calls"""
+        if self._commit_meta is not None:
+            return self._commit_meta
+        
+        self._commit_meta = {}
+        if not self.cherry_pick_commits:
+            return self._commit_meta
+        
+        # One cat-file process for every hash; unknown ones come back as '<hash> missing'
+        success, output = self.run_git_command(
+            ['git', 'cat-file', '--batch-check=%(objecttype) %(objectname)'],
+            input='\n'.join(self.cherry_pick_commits) + '\n'
+        )
+        full_hashes = {}
+        if success:
+            for commit_hash, line in zip(self.cherry_pick_commits, output.splitlines()):
+                object_type, _, object_name = line.partition(' ')
+                if object_type == 'commit':
+                    full_hashes[commit_hash] = object_name
+        
+        if not full_hashes:
+            return self._commit_meta
+        
+        success, output = self.run_git_command(
+            ['git', 'log', '--no-walk', '--pretty=format:%H %s'] + list(dict.fromkeys(full_hashes.values()))
+        )
+        subjects = {}
+        if success:
+            for line in output.splitlines():
+                full_hash, _, subject = line.partition(' ')
+                subjects[full_hash] = subject
+        
+        for commit_hash, full_hash in full_hashes.items():
+            self._commit_meta[commit_hash] = (full_hash, subjects.get(full_hash, ''))
+        
+        return self._commit_meta
     
     def validate_cherry_pick_commits(self) -> bool:
         """Validate that cherry-pick commits exist"""
         self.print_header("Validating Cherry-Pick Commits")
         
+        commit_meta = self._load_commit_meta()
         all_valid = True
         for commit_hash in self.cherry_pick_commits:
-            success, output = self.run_git_command(
-                ['git', 'cat-file', '-t', commit_hash],
-                check=False
-            )
-            
-            if success and output == 'commit':
-                success, msg = self.run_git_command(
-                    ['git', 'log', '-1', '--pretty=format:%s', commit_hash],
-                    check=False
-                )
+            if commit_hash in commit_meta:
+                _, msg = commit_meta[commit_hash]
                 self.print_success(f"Commit {commit_hash[:8]}: {msg}")
             else:
                 self.print_error(f"Commit {commit_hash} not found")
@@ -140,7 +334,6 @@ class GitHubPRAutomation:
     def validate_prerequisites(self, base_branch: str) -> bool:
         """Validate all prerequisites before starting"""
         self.print_header("Validating Prerequisites")
-        self.print_info("Fetching Latest Changes")
         
         all_valid = True
         
@@ -157,14 +350,24 @@ class GitHubPRAutomation:
                 all_valid = False
         
         # Check git repository
-        success, _ = self.run_git_command(['git', 'rev-parse', '--git-dir'], check=False)
+        success, _ = self.run_git_command(['git', 'rev-parse', '--git-dir'])
         if not success:
             self.print_error("Not in a git repository")
             all_valid = False
         
+        # Check repository access
+        try:
+            status = self._cached_get(self.api_base)
+        except requests.RequestException as e:
+            status = str(e)
+        if status == 200:
+            self.print_success(f"Repository '{self.repo_owner}/{self.repo_name}' is accessible")
+        else:
+            self.print_error(f"Cannot access repository '{self.repo_owner}/{self.repo_name}': {status}")
+            all_valid = False
+        
         # Check for uncommitted changes
-        success, output = self.run_git_command(['git', 'status', '--porcelain'], check=False)
-        if success and output:
+        if not self.is_worktree_clean():
             self.print_warning("You have uncommitted changes in your working directory")
             self.print_info("This won't affect the automation, but consider committing them")
         
@@ -174,44 +377,76 @@ class GitHubPRAutomation:
         """Get commit messages between base branch and target branch"""
         self.print_info(f"Fetching commit messages from {base_branch}...")
         
-        self.run_git_command(['git', 'fetch', 'origin', base_branch], check=False)
-        self.run_git_command(['git', 'fetch', 'origin', target_branch], check=False)
+        self.fetch_environment_branches(base_branch)
         
         success, output = self.run_git_command(
             ['git', 'log', f'origin/{target_branch}..origin/{base_branch}', 
-             '--pretty=format:%s', '--no-merges'],
-            check=False
+             '--pretty=format:%H %s', '--no-merges']
         )
         
         if success and output:
-            commits = [line.strip() for line in output.split('\n') if line.strip()]
+            entries = [line.strip().partition(' ') for line in output.split('\n') if line.strip()]
+            history = self._get_commit_history(base_branch, {sha for sha, _, _ in entries})
+            
+            commits = []
+            for sha, _, subject in entries:
+                pr_number = history.get(sha)
+                # Squash merges already end the subject with the PR number
+                if pr_number and not subject.endswith(f"(#{pr_number})"):
+                    subject = f"{subject} (#{pr_number})"
+                commits.append(subject)
             self.print_success(f"Found {len(commits)} commit(s)")
             return commits
         else:
             self.print_warning("No commits found or error fetching commits")
             return []
     
+    def _get_commit_history(self, base_branch: str, wanted: set) -> Dict[str, Optional[int]]:
+        """Get the merged PR number for commits on base branch, 100 per GraphQL request"""
+        # Every target shares the base branch history, so resume from pages already loaded
+        history, cursor, has_next = self._history_cache.get(base_branch, ({}, None, True))
+        
+        for _ in range(len(wanted) // 100 + 2):
+            # Only page further while some commits in the range are still unseen
+            if not has_next or wanted.issubset(history):
+                break
+            
+            data = self._graphql(self.COMMIT_HISTORY_QUERY, {
+                'owner': self.repo_owner,
+                'name': self.repo_name,
+                'ref': f'refs/heads/{base_branch}',
+                'cursor': cursor
+            })
+            ref = ((data or {}).get('repository') or {}).get('ref')
+            if not ref:
+                has_next = False
+                break
+            
+            page = ref['target']['history']
+            for node in page['nodes']:
+                prs = node['associatedPullRequests']['nodes']
+                history[node['oid']] = prs[0]['number'] if prs else None
+            has_next = page['pageInfo']['hasNextPage']
+            cursor = page['pageInfo']['endCursor']
+        
+        self._history_cache[base_branch] = (history, cursor, has_next)
+        return history
+    
     def get_cherry_pick_commit_messages(self) -> List[str]:
         """Get commit messages for cherry-pick commits"""
-        messages = []
-        for commit_hash in self.cherry_pick_commits:
-            success, msg = self.run_git_command(
-                ['git', 'log', '-1', '--pretty=format:%s', commit_hash],
-                check=False
-            )
-            if success:
-                messages.append(f"{commit_hash[:8]} - {msg}")
-        return messages
+        commit_meta = self._load_commit_meta()
+        return [
+            f"{commit_hash[:8]} - {commit_meta[commit_hash][1]}"
+            for commit_hash in self.cherry_pick_commits
+            if commit_hash in commit_meta
+        ]
     
     def generate_pr_description(self, commits: List[str], max_commits: int = 10) -> str:
         """Generate a formatted description from commit messages"""
         if not commits:
             return "_No new commits to describe_"
         
-        description_lines = []
-        
-        for i, commit in enumerate(commits[:max_commits], 1):
-            description_lines.append(f"{i}. {commit}")
+        description_lines = [f"{i}. {commit}" for i, commit in enumerate(commits[:max_commits], 1)]
         
         if len(commits) > max_commits:
             remaining = len(commits) - max_commits
@@ -219,129 +454,172 @@ class GitHubPRAutomation:
         
         return "\n".join(description_lines)
     
-    def create_staging_branch_with_merge(self, base_branch: str, target_branch: str, suffix: str) -> Optional[Tuple[str, bool]]:
+    def create_staging_branch_with_merge(self, base_branch: str, target_branch: str, suffix: str,
+                                         cwd: Optional[str] = None) -> Optional[Tuple[str, bool]]:
         """Create staging branch from target and merge base branch"""
         safe_base_branch = base_branch.replace('/', '-')
-        timestamp = datetime.now().strftime('%H%M')
-        staging_branch = f"{safe_base_branch}-{timestamp}-{suffix}"
+        staging_branch = f"{safe_base_branch}-{self._ts_hm}-{suffix}"
 
         self.print_info(
-            f"Creating staging branch: {staging_branch} "
+            f"[{suffix}] Creating staging branch: {staging_branch} "
             f"(from {target_branch}, merging {base_branch})"
         )
 
-        success, output = self.run_git_command(['git', 'fetch', 'origin', target_branch], check=False)
-        if not success:
-            self.print_error(f"Failed to fetch {target_branch}: {output}")
-            return None
-        
-        self.run_git_command(['git', 'fetch', 'origin', base_branch], check=False)
+        self.fetch_environment_branches(base_branch)
 
         success, output = self.run_git_command(
-            ['git', 'checkout', '-b', staging_branch, f'origin/{target_branch}'],
-            check=False
+            ['git', 'checkout', '--no-track', '-b', staging_branch, f'origin/{target_branch}'],
+            cwd=cwd
         )
         if not success:
-            self.print_error(f"Failed to create staging branch: {output}")
+            self.print_error(f"[{suffix}] Failed to create staging branch: {output}")
             return None
 
-        success, output = self.run_git_command(
+        success, output = self.run_git_command_streaming(
             ['git', 'merge', '--no-ff', f'origin/{base_branch}'],
-            check=False
+            cwd=cwd,
+            label=suffix
         )
 
         has_conflicts = not success
         
         if has_conflicts:
-            self.print_warning("Merge conflicts detected during branch creation")
-            self.print_info(f"Conflict details:\n{output}")
-            self.run_git_command(['git', 'merge', '--abort'], check=False)
-            self.print_info("Merge aborted - conflicts must be resolved before pushing")
+            self.print_warning(f"[{suffix}] Merge conflicts detected during branch creation")
+            self.run_git_command(['git', 'merge', '--abort'], cwd=cwd)
+            self.print_info(f"[{suffix}] Merge aborted - conflicts must be resolved before pushing")
             return (staging_branch, True)
         
-        success, output = self.run_git_command(
-            ['git', 'push', '-u', 'origin', staging_branch],
-            check=False
-        )
+        # Setting upstream writes the shared .git/config, so worktree callers do it afterwards
+        push_command = ['git', 'push', 'origin', staging_branch] if cwd else ['git', 'push', '-u', 'origin', staging_branch]
+        success, output = self.run_git_command_streaming(push_command, cwd=cwd, label=suffix)
         if not success:
-            self.print_error(f"Failed to push staging branch: {output}")
+            self.print_error(f"[{suffix}] Failed to push staging branch: {output}")
             return None
 
         return (staging_branch, False)
 
-    def create_staging_branch_with_cherry_pick(self, base_branch: str, target_branch: str, suffix: str) -> Optional[Tuple[str, bool]]:
+    def create_staging_branch_with_cherry_pick(self, base_branch: str, target_branch: str, suffix: str,
+                                               cwd: Optional[str] = None) -> Optional[Tuple[str, bool]]:
         """Create staging branch from target and cherry-pick commits"""
         safe_base_branch = base_branch.replace('/', '-')
-        timestamp = datetime.now().strftime('%H%M')
-        staging_branch = f"{safe_base_branch}-{timestamp}-{suffix}"
+        staging_branch = f"{safe_base_branch}-{self._ts_hm}-{suffix}"
 
         self.print_info(
-            f"Creating staging branch: {staging_branch} "
+            f"[{suffix}] Creating staging branch: {staging_branch} "
             f"(from {target_branch}, cherry-picking {len(self.cherry_pick_commits)} commit(s))"
         )
 
-        success, output = self.run_git_command(['git', 'fetch', 'origin', target_branch], check=False)
-        if not success:
-            self.print_error(f"Failed to fetch {target_branch}: {output}")
-            return None
+        self.fetch_environment_branches(base_branch)
 
         success, output = self.run_git_command(
-            ['git', 'checkout', '-b', staging_branch, f'origin/{target_branch}'],
-            check=False
+            ['git', 'checkout', '--no-track', '-b', staging_branch, f'origin/{target_branch}'],
+            cwd=cwd
         )
         if not success:
-            self.print_error(f"Failed to create staging branch: {output}")
+            self.print_error(f"[{suffix}] Failed to create staging branch: {output}")
             return None
 
         # Cherry-pick each commit
         has_conflicts = False
         for commit_hash in self.cherry_pick_commits:
-            self.print_info(f"Cherry-picking {commit_hash[:8]}...")
-            success, output = self.run_git_command(
+            self.print_info(f"[{suffix}] Cherry-picking {commit_hash[:8]}...")
+            success, output = self.run_git_command_streaming(
                 ['git', 'cherry-pick', commit_hash],
-                check=False
+                cwd=cwd,
+                label=suffix
             )
             
             if not success:
-                self.print_warning(f"Cherry-pick conflict for {commit_hash[:8]}")
-                self.print_info(f"Conflict details:\n{output}")
-                self.run_git_command(['git', 'cherry-pick', '--abort'], check=False)
+                self.print_warning(f"[{suffix}] Cherry-pick conflict for {commit_hash[:8]}")
+                self.run_git_command(['git', 'cherry-pick', '--abort'], cwd=cwd)
                 has_conflicts = True
                 break
         
         if has_conflicts:
-            self.print_info("Cherry-pick aborted - conflicts must be resolved before pushing")
+            self.print_info(f"[{suffix}] Cherry-pick aborted - conflicts must be resolved before pushing")
             return (staging_branch, True)
         
-        success, output = self.run_git_command(
-            ['git', 'push', '-u', 'origin', staging_branch],
-            check=False
-        )
+        # Setting upstream writes the shared .git/config, so worktree callers do it afterwards
+        push_command = ['git', 'push', 'origin', staging_branch] if cwd else ['git', 'push', '-u', 'origin', staging_branch]
+        success, output = self.run_git_command_streaming(push_command, cwd=cwd, label=suffix)
         if not success:
-            self.print_error(f"Failed to push staging branch: {output}")
+            self.print_error(f"[{suffix}] Failed to push staging branch: {output}")
             return None
 
-        self.print_success(f"All commits cherry-picked successfully")
+        self.print_success(f"[{suffix}] All commits cherry-picked successfully")
         return (staging_branch, False)
     
+    def _create_staging_branch(self, base_branch: str, env_config: dict,
+                               cwd: Optional[str] = None) -> Optional[Tuple[str, bool]]:
+        """Create the staging branch for an environment using the active mode"""
+        if self.cherry_pick_commits:
+            return self.create_staging_branch_with_cherry_pick(
+                base_branch, env_config['branch'], env_config['suffix'], cwd=cwd
+            )
+        return self.create_staging_branch_with_merge(
+            base_branch, env_config['branch'], env_config['suffix'], cwd=cwd
+        )
+    
+    def stage_environments(self, base_branch: str):
+        """Create all staging branches in parallel, each in its own worktree"""
+        self.print_header("Preparing Staging Branches")
+        
+        # Worktree creation touches shared .git metadata, so do it up front
+        worktrees = {}
+        for env_config in self.environments:
+            path = tempfile.mkdtemp(prefix=f"pr-auto-{env_config['suffix']}-")
+            success, output = self.run_git_command(
+                ['git', 'worktree', 'add', '--detach', path, f"origin/{env_config['branch']}"]
+            )
+            if success:
+                worktrees[env_config['name']] = path
+            else:
+                os.rmdir(path)
+                self.print_warning(f"Could not create worktree for {env_config['name']}: {output}")
+        
+        if not worktrees:
+            return
+        
+        try:
+            with ThreadPoolExecutor(max_workers=min(3, len(worktrees))) as executor:
+                futures = {
+                    env_config['name']: executor.submit(
+                        self._create_staging_branch, base_branch, env_config, worktrees[env_config['name']]
+                    )
+                    for env_config in self.environments
+                    if env_config['name'] in worktrees
+                }
+                for env_name, future in futures.items():
+                    self._staged[env_name] = future.result()
+        finally:
+            for path in worktrees.values():
+                self.run_git_command(['git', 'worktree', 'remove', '--force', path])
+        
+        for branch_result in self._staged.values():
+            if branch_result and not branch_result[1]:
+                staging_branch = branch_result[0]
+                self.run_git_command(
+                    ['git', 'branch', f'--set-upstream-to=origin/{staging_branch}', staging_branch]
+                )
+    
     def wait_for_conflict_resolution_merge(self, staging_branch: str, target_branch: str, base_branch: str, env_name: str) -> bool:
         """Guide user through merge conflict resolution"""
         self.print_warning(f"\n{'='*70}")
         self.print_warning("MERGE CONFLICT RESOLUTION REQUIRED")
         self.print_warning(f"{'='*70}")
         
-        print(f"\n{Colors.BOLD}Environment:{Colors.ENDC} {env_name}")
-        print(f"{Colors.BOLD}Staging Branch:{Colors.ENDC} {staging_branch}")
-        print(f"{Colors.BOLD}Target Branch:{Colors.ENDC} {target_branch}")
-        print(f"{Colors.BOLD}Base Branch:{Colors.ENDC} {base_branch}")
+        print(f"\n{self._b}Environment:{self._e} {env_name}")
+        print(f"{self._b}Staging Branch:{self._e} {staging_branch}")
+        print(f"{self._b}Target Branch:{self._e} {target_branch}")
+        print(f"{self._b}Base Branch:{self._e} {base_branch}")
         
-        print(f"\n{Colors.OKCYAN}Steps to resolve:{Colors.ENDC}")
-        print(f"  1. Checkout: {Colors.BOLD}git checkout {staging_branch}{Colors.ENDC}")
-        print(f"  2. Merge: {Colors.BOLD}git merge --no-ff origin/{base_branch}{Colors.ENDC}")
+        print(f"\n{self._c}Steps to resolve:{self._e}")
+        print(f"  1. Checkout: {self._b}git checkout {staging_branch}{self._e}")
+        print(f"  2. Merge: {self._b}git merge --no-ff origin/{base_branch}{self._e}")
         print(f"  3. Resolve conflicts in your editor")
-        print(f"  4. Stage files: {Colors.BOLD}git add .{Colors.ENDC}")
-        print(f"  5. Commit: {Colors.BOLD}git commit{Colors.ENDC}")
-        print(f"  6. Push: {Colors.BOLD}git push -u origin {staging_branch}{Colors.ENDC}")
+        print(f"  4. Stage files: {self._b}git add .{self._e}")
+        print(f"  5. Commit: {self._b}git commit{self._e}")
+        print(f"  6. Push: {self._b}git push -u origin {staging_branch}{self._e}")
         
         return self._wait_for_resolution(staging_branch, env_name, base_branch)
 
@@ -351,55 +629,53 @@ class GitHubPRAutomation:
         self.print_warning("CHERRY-PICK CONFLICT RESOLUTION REQUIRED")
         self.print_warning(f"{'='*70}")
         
-        print(f"\n{Colors.BOLD}Environment:{Colors.ENDC} {env_name}")
-        print(f"{Colors.BOLD}Staging Branch:{Colors.ENDC} {staging_branch}")
-        print(f"{Colors.BOLD}Commits to cherry-pick:{Colors.ENDC}")
+        print(f"\n{self._b}Environment:{self._e} {env_name}")
+        print(f"{self._b}Staging Branch:{self._e} {staging_branch}")
+        print(f"{self._b}Commits to cherry-pick:{self._e}")
         for commit in self.cherry_pick_commits:
             print(f"  - {commit[:8]}")
         
-        print(f"\n{Colors.OKCYAN}Steps to resolve:{Colors.ENDC}")
-        print(f"  1. Checkout: {Colors.BOLD}git checkout {staging_branch}{Colors.ENDC}")
+        print(f"\n{self._c}Steps to resolve:{self._e}")
+        print(f"  1. Checkout: {self._b}git checkout {staging_branch}{self._e}")
         print(f"  2. Cherry-pick each commit:")
         for commit in self.cherry_pick_commits:
-            print(f"     {Colors.BOLD}git cherry-pick {commit}{Colors.ENDC}")
+            print(f"     {self._b}git cherry-pick {commit}{self._e}")
         print(f"  3. Resolve conflicts if any")
-        print(f"  4. Stage files: {Colors.BOLD}git add .{Colors.ENDC}")
-        print(f"  5. Continue: {Colors.BOLD}git cherry-pick --continue{Colors.ENDC}")
+        print(f"  4. Stage files: {self._b}git add .{self._e}")
+        print(f"  5. Continue: {self._b}git cherry-pick --continue{self._e}")
         print(f"  6. Repeat for remaining commits")
-        print(f"  7. Push: {Colors.BOLD}git push -u origin {staging_branch}{Colors.ENDC}")
+        print(f"  7. Push: {self._b}git push -u origin {staging_branch}{self._e}")
         
         return self._wait_for_resolution(staging_branch, env_name, None)
     
     def _wait_for_resolution(self, staging_branch: str, env_name: str, base_branch: Optional[str]) -> bool:
         """Common conflict resolution wait logic"""
-        self.run_git_command(['git', 'checkout', staging_branch], check=False)
+        self.run_git_command(['git', 'checkout', staging_branch])
         
         if base_branch:
             self.print_info("\nAttempting merge to show conflicts...")
-            self.run_git_command(['git', 'merge', '--no-ff', f'origin/{base_branch}'], check=False)
+            self.run_git_command_streaming(['git', 'merge', '--no-ff', f'origin/{base_branch}'])
         else:
             self.print_info("\nAttempting cherry-pick to show conflicts...")
             for commit in self.cherry_pick_commits:
-                success, _ = self.run_git_command(['git', 'cherry-pick', commit], check=False)
+                success, _ = self.run_git_command_streaming(['git', 'cherry-pick', commit])
                 if not success:
                     break
         
         while True:
-            print(f"\n{Colors.BOLD}What would you like to do?{Colors.ENDC}")
+            print(f"\n{self._b}What would you like to do?{self._e}")
             print("  1. I've resolved conflicts and pushed - Continue")
             print("  2. Skip this environment")
             print("  3. Stop entire process")
             
-            choice = input(f"\n{Colors.OKCYAN}Enter choice (1/2/3): {Colors.ENDC}").strip()
+            choice = input(f"\n{self._c}Enter choice (1/2/3): {self._e}").strip()
             
             if choice == '1':
                 self.print_info("Verifying conflict resolution...")
                 
-                self.run_git_command(['git', 'fetch', 'origin', staging_branch], check=False)
-                
-                success, _ = self.run_git_command(
-                    ['git', 'rev-parse', f'origin/{staging_branch}'],
-                    check=False
+                # Ask the remote directly instead of fetching the branch
+                success, output = self.run_git_command(
+                    ['git', 'ls-remote', '--exit-code', '--heads', 'origin', f'refs/heads/{staging_branch}']
                 )
                 
                 if not success:
@@ -407,9 +683,16 @@ class GitHubPRAutomation:
                     self.print_error(f"Please push: git push -u origin {staging_branch}")
                     continue
                 
-                success, output = self.run_git_command(['git', 'status', '--porcelain'], check=False)
+                remote_sha = output.split()[0]
+                success, local_sha = self.run_git_command(['git', 'rev-parse', 'HEAD'])
+                if success and local_sha != remote_sha:
+                    self.print_warning(
+                        f"Local HEAD ({local_sha[:8]}) differs from origin/{staging_branch} ({remote_sha[:8]})"
+                    )
+                    self.print_info(f"Please push: git push -u origin {staging_branch}")
+                    continue
                 
-                if success and output:
+                if not self.is_worktree_clean():
                     self.print_warning("You have uncommitted changes")
                     self.print_info("Please commit and push all changes")
                     continue
@@ -419,19 +702,122 @@ class GitHubPRAutomation:
             
             elif choice == '2':
                 self.print_warning(f"Skipping {env_name} environment")
-                self.run_git_command(['git', 'merge', '--abort'], check=False)
-                self.run_git_command(['git', 'cherry-pick', '--abort'], check=False)
+                self.run_git_command(['git', 'merge', '--abort'])
+                self.run_git_command(['git', 'cherry-pick', '--abort'])
                 return False
             
             elif choice == '3':
                 self.print_warning("Stopping entire process")
-                self.run_git_command(['git', 'merge', '--abort'], check=False)
-                self.run_git_command(['git', 'cherry-pick', '--abort'], check=False)
+                self.run_git_command(['git', 'merge', '--abort'])
+                self.run_git_command(['git', 'cherry-pick', '--abort'])
                 sys.exit(0)
             
             else:
                 self.print_error("Invalid choice. Please enter 1, 2, or 3")
     
+    def _post_with_rate_limit(self, url: str, payload: dict, max_retries: int = 5) -> requests.Response:
+        """POST to the GitHub API, waiting out primary/secondary rate limits"""
+        for attempt in range(max_retries + 1):
+            response = self.session.post(url, json=payload)
+            if response.status_code not in (403, 429) or attempt == max_retries:
+                return response
+
+            retry_after = response.headers.get('Retry-After')
+            reset = response.headers.get('X-RateLimit-Reset')
+            if retry_after:
+                delay = self._parse_retry_after(retry_after, attempt)
+            elif response.headers.get('X-RateLimit-Remaining') == '0' and reset and reset.isdigit():
+                delay = max(0, int(reset) - int(time.time()))
+            elif response.status_code == 429 or 'rate limit' in response.text.lower():
+                delay = 2 ** attempt
+            else:
+                # Plain 403 (e.g. missing permissions) - retrying won't help
+                return response
+
+            if delay > self.MAX_RATE_LIMIT_WAIT:
+                self.print_error(
+                    f"Rate limited by GitHub ({response.status_code}) for {delay}s, "
+                    f"longer than the {self.MAX_RATE_LIMIT_WAIT}s wait limit - not retrying"
+                )
+                return response
+
+            self.print_warning(f"Rate limited by GitHub ({response.status_code}), retrying in {delay}s...")
+            time.sleep(delay)
+
+        return response
+
+    def _parse_retry_after(self, value: str, attempt: int) -> int:
+        """Seconds to wait from a Retry-After header, which may be delta-seconds or an HTTP-date"""
+        if value.isdigit():
+            return int(value)
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            retry_at = None
+        if retry_at is None:
+            return 2 ** attempt
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0, int(retry_at.timestamp() - time.time()))
+
+    def _load_etag_cache(self) -> Dict[str, str]:
+        """Load the on-disk ETag cache once per run"""
+        if self._etag_cache is None:
+            try:
+                with open(self.ETAG_CACHE_PATH, encoding='utf-8') as f:
+                    cache = json.load(f)
+            except (OSError, ValueError):
+                cache = None
+            # A hand-edited or older cache file is treated as empty rather than trusted
+            self._etag_cache = cache if isinstance(cache, dict) else {}
+        return self._etag_cache
+    
+    def _save_etag_cache(self):
+        """Persist the ETag cache; failures only cost a future cache miss"""
+        try:
+            os.makedirs(os.path.dirname(self.ETAG_CACHE_PATH), exist_ok=True)
+            with open(self.ETAG_CACHE_PATH, 'w', encoding='utf-8') as f:
+                json.dump(self._etag_cache, f)
+        except OSError:
+            pass
+    
+    def _cached_get(self, url: str) -> int:
+        """GET with If-None-Match; a 304 counts as 200 and doesn't count against the rate limit"""
+        cache = self._load_etag_cache()
+        cached = cache.get(url)
+        headers = {'If-None-Match': cached} if isinstance(cached, str) else {}
+        
+        response = self.session.get(url, headers=headers)
+        
+        if response.status_code == 304 and headers:
+            return 200
+        
+        # Only the status is used, so just the ETag is kept, and the file is rewritten only when it changes
+        etag = response.headers.get('ETag')
+        if response.status_code == 200 and etag and etag != cached:
+            cache[url] = etag
+            self._save_etag_cache()
+        return response.status_code
+    
+    def _graphql(self, query: str, variables: dict) -> Optional[dict]:
+        """Run a GraphQL query, returning its data or None on any failure"""
+        try:
+            response = self._post_with_rate_limit(
+                self.graphql_url,
+                payload={'query': query, 'variables': variables}
+            )
+            
+            if response.status_code != 200:
+                return None
+            payload = response.json()
+            if payload.get('errors'):
+                return None
+            return payload.get('data')
+            
+        except Exception as e:
+            self.print_warning(f"Exception during GraphQL query: {str(e)}")
+            return None
+    
     def add_reviewers_to_pr(self, pr_number: int) -> bool:
         """Add reviewers to a pull request"""
         if not self.reviewers:
@@ -442,10 +828,9 @@ class GitHubPRAutomation:
         reviewer_data = {'reviewers': self.reviewers}
         
         try:
-            response = requests.post(
+            response = self._post_with_rate_limit(
                 f"{self.api_base}/pulls/{pr_number}/requested_reviewers",
-                headers=self.headers,
-                json=reviewer_data
+                payload=reviewer_data
             )
             
             if response.status_code in [201, 200]:
@@ -487,16 +872,14 @@ class GitHubPRAutomation:
             if refs:
                 pr_references = f"\n\n### Related PRs\n" + "\n".join(f"- {ref}" for ref in refs)
         
-        env_index = next((i for i, e in enumerate(self.environments) if e['name'] == env_name), None)
-        
         previous_envs = ""
-        if env_index and env_index > 0:
-            prev_names = [self.environments[i]['name'] for i in range(env_index)]
+        prev_names = self._prev_names.get(env_name)
+        if prev_names:
             previous_envs = f"\n_Previous: {' ✓ | '.join(prev_names)} ✓_"
         
         next_envs = ""
-        if env_index is not None and env_index < len(self.environments) - 1:
-            next_names = [self.environments[i]['name'] for i in range(env_index + 1, len(self.environments))]
+        next_names = self._next_names.get(env_name)
+        if next_names:
             next_envs = f"\n_Next: {' → '.join(next_names)}_"
         
         warning = ""
@@ -507,25 +890,24 @@ class GitHubPRAutomation:
             'title': f"{title_prefix}: {source_reference}",
             'head': staging_branch,
             'base': target_branch,
-            'body': f"""
-**Source:** `{source_reference}`
-
-### Changes
-{commit_description}
-{pr_references}
-
----
-{previous_envs}{next_envs}{warning}
-
-_Created by PR Automation Tool at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}_
-"""
+            'body': "\n".join([
+                f"**Source:** `{source_reference}`",
+                "",
+                "### Changes",
+                commit_description,
+                pr_references,
+                "",
+                "---",
+                previous_envs + next_envs + warning,
+                "",
+                self._pr_footer
+            ])
         }
         
         try:
-            response = requests.post(
+            response = self._post_with_rate_limit(
                 f"{self.api_base}/pulls",
-                headers=self.headers,
-                json=pr_data
+                payload=pr_data
             )
             
             if response.status_code == 201:
@@ -550,7 +932,6 @@ _Created by PR Automation Tool at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
         """Process a single environment"""
         env_name = env_config['name']
         target_branch = env_config['branch']
-        suffix = env_config['suffix']
         title_prefix = env_config['title_prefix']
         
         self.print_header(f"Processing {env_name} Environment")
@@ -565,13 +946,12 @@ _Created by PR Automation Tool at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
             'skipped': False
         }
         
-        # Create staging branch based on mode
-        if self.cherry_pick_commits:
-            branch_result = self.create_staging_branch_with_cherry_pick(base_branch, target_branch, suffix)
-            source_reference = f"{base_branch}"
+        # Use the branch prepared by stage_environments, or create it now
+        if env_name in self._staged:
+            branch_result = self._staged.pop(env_name)
         else:
-            branch_result = self.create_staging_branch_with_merge(base_branch, target_branch, suffix)
-            source_reference = base_branch
+            branch_result = self._create_staging_branch(base_branch, env_config)
+        source_reference = base_branch
         
         if not branch_result:
             self.print_error(f"Failed to create staging branch for {env_name}")
@@ -616,30 +996,38 @@ _Created by PR Automation Tool at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
     def run(self, base_branch: str):
         """Main execution flow"""
         self.print_header("Sequential PR Creation Tool")
-        print(f"{Colors.BOLD}Repository:{Colors.ENDC} {self.repo_owner}/{self.repo_name}")
-        print(f"{Colors.BOLD}Base Branch:{Colors.ENDC} {base_branch}")
+        print(f"{self._b}Repository:{self._e} {self.repo_owner}/{self.repo_name}")
+        print(f"{self._b}Base Branch:{self._e} {base_branch}")
         
         if self.cherry_pick_commits:
-            print(f"{Colors.BOLD}Mode:{Colors.ENDC} Cherry-Pick")
-            print(f"{Colors.BOLD}Commits:{Colors.ENDC}")
+            print(f"{self._b}Mode:{self._e} Cherry-Pick")
+            print(f"{self._b}Commits:{self._e}")
             for commit in self.cherry_pick_commits:
                 print(f"  - {commit[:8]}")
         else:
-            print(f"{Colors.BOLD}Mode:{Colors.ENDC} Merge")
+            print(f"{self._b}Mode:{self._e} Merge")
         
-        print(f"{Colors.BOLD}Target Environments:{Colors.ENDC} {', '.join([e['name'] for e in self.environments])}")
+        print(f"{self._b}Target Environments:{self._e} {', '.join([e['name'] for e in self.environments])}")
         if self.reviewers:
-            print(f"{Colors.BOLD}Reviewers:{Colors.ENDC} {', '.join(self.reviewers)}")
-        print(f"{Colors.BOLD}Timestamp:{Colors.ENDC} {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+            print(f"{self._b}Reviewers:{self._e} {', '.join(self.reviewers)}")
+        print(f"{self._b}Timestamp:{self._e} {self._ts_full}\n")
         
-        # Fetch all latest changes
-        self.fetch_all_latest_changes()
+        # Cherry-pick validation needs the commits locally; merge mode only
+        # needs the base ref, so the full fetch can wait until validation passes
+        if self.cherry_pick_commits:
+            self.fetch_all_latest_changes()
         
         # Validate prerequisites
         if not self.validate_prerequisites(base_branch):
             self.print_error("\nValidation failed. Fix issues above.")
             sys.exit(1)
         
+        if not self.cherry_pick_commits:
+            self.fetch_all_latest_changes()
+        
+        self.fetch_environment_branches(base_branch)
+        self.stage_environments(base_branch)
+        
         results = []
         
         for env_config in self.environments:
@@ -663,17 +1051,17 @@ _Created by PR Automation Tool at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
         for result in results:
             env = result['environment']
             if result['success']:
-                print(f"{Colors.OKGREEN}✓ {env}:{Colors.ENDC}")
+                print(f"{self._g}✓ {env}:{self._e}")
                 print(f"  Branch: {result['staging_branch']}")
                 print(f"  PR #{result['pr_number']}: {result['pr_url']}")
             elif result['skipped']:
-                print(f"{Colors.WARNING}⊘ {env}: Skipped by user{Colors.ENDC}")
+                print(f"{self._y}⊘ {env}: Skipped by user{self._e}")
                 print(f"  Branch: {result['staging_branch']}")
             elif result['has_conflicts']:
-                print(f"{Colors.WARNING}⚠ {env}: Conflicts detected{Colors.ENDC}")
+                print(f"{self._y}⚠ {env}: Conflicts detected{self._e}")
                 print(f"  Branch: {result['staging_branch']}")
             else:
-                print(f"{Colors.FAIL}✗ {env}: Failed{Colors.ENDC}")
+                print(f"{self._r}✗ {env}: Failed{self._e}")
             print()
         
         successful = [r for r in results if r['success']]